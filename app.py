@@ -1,31 +1,52 @@
-import json
+import atexit
+import contextlib
+import functools
+import heapq
 import logging
 import os
+import queue
 import threading
 import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import orjson
 import posthog
 from flask import Flask, Response, jsonify, render_template, request
 from slack_bolt import App
 from slack_bolt.adapter.flask import SlackRequestHandler
 from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
+from sqlalchemy.exc import SQLAlchemyError
 
 from models import (
     Poll,
     Session,
     Vote,
-    delete_vote,
-    get_expired_polls,
+    close_polls,
+    count_polls,
+    delete_votes_by_id,
     get_poll_by_id,
+    get_polls_by_ids,
+    get_polls_with_deadline,
+    get_user_vote_ids,
+    get_vote_summary,
+    get_voters_by_option,
+    init_db,
+    insert_vote,
     save_poll,
-    save_vote,
+    save_poll_with_options,
 )
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging; LOG_LEVEL can raise it above the verbose debug default
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "DEBUG").upper())
 logger = logging.getLogger(__name__)
 
+# Create the schema on startup, before the expiry checker queries it
+init_db()
+
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET")
@@ -38,6 +59,9 @@ slack_app = App(
     signing_secret=os.environ.get("SLACK_SIGNING_SECRET"),
     process_before_response=True,
 )
+# Every listener's client is copied from the app's, along with its retry
+# handlers, so a rate-limited chat_update is retried rather than dropped
+slack_app.client.retry_handlers.append(RateLimitErrorRetryHandler(max_retry_count=2))
 
 
 # Create a handler that will be used to process Slack events
@@ -54,220 +78,546 @@ class CustomSlackRequestHandler(SlackRequestHandler):
 handler = CustomSlackRequestHandler(slack_app)
 
 
-# Background thread to check for expired polls
-def check_expired_polls():
-    while True:
+# Slack API calls are handed off to a bounded worker pool so listeners can
+# return as soon as the database has been updated
+SLACK_IO_WORKERS = 16
+SLACK_IO_MAX_PENDING = 64
+_slack_exec = ThreadPoolExecutor(
+    max_workers=SLACK_IO_WORKERS, thread_name_prefix="slack-io"
+)
+_slack_slots = threading.BoundedSemaphore(SLACK_IO_MAX_PENDING)
+
+
+def submit_slack_call(fn, *args):
+    """Run a Slack API call on the worker pool, blocking if too many are pending"""
+    _slack_slots.acquire()
+
+    def run():
         try:
-            # Use the get_expired_polls function instead of accessing Poll.polls
-            expired_polls = get_expired_polls()
+            fn(*args)
+        except Exception as e:
+            logger.error(f"Error in background Slack call {fn.__name__}: {e}")
+        finally:
+            # Start every task from a fresh session so reloaded polls are current
+            Session.remove()
+            _slack_slots.release()
+
+    try:
+        return _slack_exec.submit(run)
+    except Exception:
+        _slack_slots.release()
+        raise
 
-            for poll in expired_polls:
-                logger.info(f"Automatically closing poll {poll.id} due to deadline")
-                poll.closed = True
-                save_poll(poll)
 
-                # Update the message to reflect that the poll is closed
-                try:
-                    if poll.channel_id and poll.message_ts:
-                        slack_app.client.chat_update(
-                            channel=poll.channel_id,
-                            ts=poll.message_ts,
-                            blocks=generate_poll_blocks(poll),
-                        )
-                    else:
-                        logger.error(
-                            f"Missing channel_id or message_ts for poll {poll.id}"
-                        )
-                except SlackApiError as e:
-                    logger.error(f"Error updating poll message: {e}")
+# Analytics events are queued and sent from a single background thread so a
+# slow PostHog call never holds up a Slack listener. If the queue fills up,
+# new events are dropped rather than blocking.
+ANALYTICS_QUEUE_SIZE = 10_000
+_analytics_queue = queue.Queue(maxsize=ANALYTICS_QUEUE_SIZE)
+
+
+def capture_event(event, properties):
+    """Queue an analytics event for the background sender"""
+    try:
+        _analytics_queue.put_nowait((event, properties))
+    except queue.Full:
+        logger.warning(f"Analytics queue full, dropping event {event}")
+
+
+def _send_analytics_events():
+    while True:
+        item = _analytics_queue.get()
+        if item is None:
+            return
+        event, properties = item
+        try:
+            posthog.capture(event, properties=properties)
         except Exception as e:
-            logger.error(f"Error in expired polls check: {e}")
+            logger.error(f"Error sending analytics event {event}: {e}")
+
+
+def stop_analytics_sender():
+    """Send any queued events, then flush PostHog's own buffer"""
+    try:
+        _analytics_queue.put_nowait(None)
+    except queue.Full:
+        # Don't wait on a backlog at shutdown; the events left are dropped
+        logger.warning("Analytics queue full at shutdown, dropping queued events")
+    else:
+        analytics_thread.join(timeout=5)
+    # posthog refuses to flush without an API key
+    if posthog.api_key:
+        posthog.flush()
+
+
+analytics_thread = threading.Thread(
+    target=_send_analytics_events, name="analytics", daemon=True
+)
+analytics_thread.start()
+atexit.register(stop_analytics_sender)
+
+
+def update_poll_message(client, channel, ts, blocks):
+    try:
+        client.chat_update(channel=channel, ts=ts, blocks=blocks)
+    except SlackApiError as e:
+        logger.error(f"Error updating poll message: {e}")
+
+
+def refresh_poll_message(client, poll_id, channel, ts):
+    poll = get_poll_by_id(poll_id)
+    if not poll:
+        logger.error(f"Poll not found: {poll_id}")
+        return
+    update_poll_message(client, channel, ts, generate_poll_blocks(poll))
+
+
+# Votes arriving in a burst are coalesced into a single chat_update per
+# message: the first vote arms a timer, later ones within the window ride on
+# it, and the flush reloads the poll so it always renders the latest state.
+VOTE_UPDATE_DELAY_SECONDS = 0.5
+_pending_updates = {}
+_pending_updates_lock = threading.Lock()
+
+
+def schedule_poll_update(client, poll_id, channel, ts):
+    with _pending_updates_lock:
+        if ts in _pending_updates:
+            return
+        timer = threading.Timer(
+            VOTE_UPDATE_DELAY_SECONDS,
+            _flush_poll_update,
+            args=(client, poll_id, channel, ts),
+        )
+        timer.daemon = True
+        _pending_updates[ts] = timer
+    timer.start()
+
+
+def _flush_poll_update(client, poll_id, channel, ts):
+    with _pending_updates_lock:
+        _pending_updates.pop(ts, None)
+    submit_slack_call(refresh_poll_message, client, poll_id, channel, ts)
+
+
+# Writes to the same poll are serialized: concurrent clicks must not act on
+# the same snapshot of a user's votes, and every write also bumps the poll
+# row's version, which DuckDB rejects from two overlapping transactions. A
+# writer loads the poll only once it holds the lock, so its transaction starts
+# after the previous write committed. Locks live only while in use.
+_poll_locks = weakref.WeakValueDictionary()
+_poll_locks_guard = threading.Lock()
+
+
+def _lock_for(poll_id):
+    with _poll_locks_guard:
+        lock = _poll_locks.get(poll_id)
+        if lock is None:
+            lock = _poll_locks[poll_id] = threading.RLock()
+        return lock
+
 
-        # Check every minute
-        time.sleep(60)
+def post_poll_message(client, poll_id, channel, blocks, text):
+    try:
+        result = client.chat_postMessage(channel=channel, blocks=blocks, text=text)
+    except SlackApiError as e:
+        logger.error(f"Error posting poll: {e}")
+        return
+
+    # Store the message timestamp for later updates
+    with _lock_for(poll_id):
+        poll = get_poll_by_id(poll_id)
+        if poll:
+            poll.message_ts = result["ts"]
+            save_poll(poll)
+            # The deadline is only registered once the message can be updated,
+            # so a poll that is already due still gets its closed blocks
+            schedule_poll_deadline(poll)
+
+
+# Deadlines of open polls, as a min-heap of (deadline timestamp, poll id), so
+# the background thread can sleep until the next poll is actually due
+_deadline_heap = []
+_deadline_cv = threading.Condition()
+
+
+def schedule_poll_deadline(poll):
+    """Register a poll's deadline with the expiry thread"""
+    if not poll.deadline or poll.closed:
+        return
+    with _deadline_cv:
+        heapq.heappush(_deadline_heap, (poll.deadline.timestamp(), poll.id))
+        _deadline_cv.notify()
+
+
+def _pop_due_polls():
+    """Pop the ids of all polls whose deadline has passed"""
+    now = time.time()
+    due_poll_ids = []
+    with _deadline_cv:
+        while _deadline_heap and _deadline_heap[0][0] <= now:
+            due_poll_ids.append(heapq.heappop(_deadline_heap)[1])
+    return due_poll_ids
+
+
+# A sweep that fails is retried after a short delay instead of leaving its
+# polls open until the next restart. Polls the sweep has closed are kept
+# until their messages are updated, since the retry cannot close them again.
+EXPIRY_RETRY_SECONDS = 5
+_unannounced_poll_ids = set()
+
+
+def _reschedule_polls(poll_ids, delay):
+    """Push polls back onto the deadline heap to be swept again after a delay"""
+    due = time.time() + delay
+    with _deadline_cv:
+        for poll_id in poll_ids:
+            heapq.heappush(_deadline_heap, (due, poll_id))
+        _deadline_cv.notify()
+
+
+def check_expired_polls_once():
+    """Close every poll that is past its deadline and update its message"""
+    due_poll_ids = _pop_due_polls()
+    if not due_poll_ids:
+        return
+    try:
+        # Close the due polls that are still open with a single UPDATE
+        with contextlib.ExitStack() as locks:
+            # Always taken in the same order; other threads hold one at a time
+            for poll_id in sorted(due_poll_ids):
+                locks.enter_context(_lock_for(poll_id))
+            _unannounced_poll_ids.update(close_polls(due_poll_ids))
+        if not _unannounced_poll_ids:
+            return
+
+        # Update the messages to reflect that the polls are closed
+        poll_ids = list(_unannounced_poll_ids)
+        for poll in get_polls_by_ids(poll_ids):
+            logger.info(f"Automatically closed poll {poll.id} due to deadline")
+            if poll.channel_id and poll.message_ts:
+                submit_slack_call(
+                    update_poll_message,
+                    slack_app.client,
+                    poll.channel_id,
+                    poll.message_ts,
+                    generate_poll_blocks(poll),
+                )
+            else:
+                logger.error(f"Missing channel_id or message_ts for poll {poll.id}")
+            _unannounced_poll_ids.discard(poll.id)
+        # Polls deleted in the meantime have no message left to update
+        _unannounced_poll_ids.difference_update(poll_ids)
+    except Exception as e:
+        logger.error(f"Error in expired polls check, retrying: {e}")
+        _reschedule_polls(due_poll_ids, EXPIRY_RETRY_SECONDS)
+    finally:
+        Session.remove()
+
+
+_expiry_stopped = False
+
+
+def stop_expiry_checker():
+    """Wake the expiry thread and wait for it to exit"""
+    global _expiry_stopped
+    with _deadline_cv:
+        _expiry_stopped = True
+        _deadline_cv.notify_all()
+    # Let a query in progress finish rather than kill the thread inside DuckDB
+    poll_checker_thread.join(timeout=5)
+
+
+# Background thread to close polls when their deadline passes. It blocks
+# without a timeout while no poll has a deadline, so it costs nothing idle.
+def check_expired_polls():
+    try:
+        for poll in get_polls_with_deadline():
+            schedule_poll_deadline(poll)
+    except Exception as e:
+        logger.error(f"Error loading poll deadlines: {e}")
+    finally:
+        Session.remove()
+
+    while True:
+        with _deadline_cv:
+            while not _expiry_stopped and (
+                not _deadline_heap or _deadline_heap[0][0] > time.time()
+            ):
+                timeout = _deadline_heap[0][0] - time.time() if _deadline_heap else None
+                _deadline_cv.wait(timeout=timeout)
+            if _expiry_stopped:
+                return
+
+        check_expired_polls_once()
 
 
 # Start the background thread
-poll_checker_thread = threading.Thread(target=check_expired_polls, daemon=True)
+poll_checker_thread = threading.Thread(
+    target=check_expired_polls, name="poll-expiry", daemon=True
+)
 poll_checker_thread.start()
+atexit.register(stop_expiry_checker)
+
+
+# Rendered blocks are cached as JSON strings, keyed on the poll state that
+# affects the output. Every write helper in models bumps poll.version, so
+# stale entries are never hit again and simply age out of the LRU.
+BLOCKS_CACHE_SIZE = 512
+_blocks_cache = OrderedDict()
+# Closed polls never change again, so their renders are kept in a separate,
+# larger LRU where churn from open polls cannot evict them
+CLOSED_BLOCKS_CACHE_SIZE = 1024
+_closed_blocks_cache = OrderedDict()
+_blocks_cache_lock = threading.Lock()
+
+
+def cached_blocks(generate):
+    @functools.wraps(generate)
+    def wrapper(poll):
+        key = (
+            generate.__name__,
+            poll.id,
+            poll.version,
+            poll.closed,
+            poll.hide_votes,
+            poll.hide_vote_count,
+        )
+        if poll.closed:
+            cache, max_size = _closed_blocks_cache, CLOSED_BLOCKS_CACHE_SIZE
+        else:
+            cache, max_size = _blocks_cache, BLOCKS_CACHE_SIZE
+
+        with _blocks_cache_lock:
+            blocks_json = cache.get(key)
+            if blocks_json is not None:
+                cache.move_to_end(key)
+                return blocks_json
+
+        blocks_json = generate(poll)
+
+        with _blocks_cache_lock:
+            cache[key] = blocks_json
+            if len(cache) > max_size:
+                cache.popitem(last=False)
+        return blocks_json
+
+    return wrapper
+
+
+# Invariant block fragments are serialized once at import; renders only
+# encode the dynamic parts and join the fragments into a blocks array
+def _dumps(obj):
+    return orjson.dumps(obj).decode()
+
+
+def _json_template(block, slot="__POLL_ID__"):
+    """Serialize a block once, leaving a slot for one value (the poll id by default)"""
+    prefix, suffix = _dumps(block).split(_dumps(slot))
+    return lambda value: prefix + _dumps(value) + suffix
+
+
+def _join_blocks(fragments):
+    return "[" + ",".join(fragments) + "]"
+
+
+_DIVIDER_JSON = _dumps({"type": "divider"})
+_MULTIPLE_VOTES_JSON = _dumps({"type": "mrkdwn", "text": "✅ *Multiple votes allowed*"})
+_SINGLE_VOTE_JSON = _dumps({"type": "mrkdwn", "text": "🔒 *Single vote only*"})
+_HIDE_VOTES_JSON = _dumps(
+    {"type": "mrkdwn", "text": "👁️‍🗨️ *Individual votes hidden until poll closes*"}
+)
+_HIDE_VOTE_COUNT_JSON = _dumps(
+    {"type": "mrkdwn", "text": "🔢 *Option vote counts hidden until poll closes*"}
+)
+_POLL_CLOSED_JSON = _dumps({"type": "mrkdwn", "text": "🚫 *This poll is closed*"})
+_vote_button_json = _json_template(
+    {
+        "type": "button",
+        "text": {"type": "plain_text", "text": "Vote"},
+        "value": "__VOTE_VALUE__",
+        "action_id": "vote_button",
+        "style": "primary",
+    },
+    slot="__VOTE_VALUE__",
+)
+_close_poll_actions_json = _json_template(
+    {
+        "type": "actions",
+        "elements": [
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "Close Poll"},
+                "value": "__POLL_ID__",
+                "action_id": "close_poll",
+                "style": "danger",
+            }
+        ],
+    }
+)
+_show_results_actions_json = _json_template(
+    {
+        "type": "actions",
+        "elements": [
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "Show Results"},
+                "value": "__POLL_ID__",
+                "action_id": "show_results",
+            }
+        ],
+    }
+)
 
 
 # Helper function to generate poll blocks for Slack messages
+@cached_blocks
 def generate_poll_blocks(poll):
     blocks = [
-        {
-            "type": "header",
-            "text": {"type": "plain_text", "text": f"📊 {poll.question}"},
-        },
-        {"type": "divider"},
+        _dumps(
+            {
+                "type": "header",
+                "text": {"type": "plain_text", "text": f"📊 {poll.question}"},
+            }
+        ),
+        _DIVIDER_JSON,
     ]
 
+    # Only show option vote counts and individual voters if not hidden or if
+    # the poll is closed
+    show_counts = not poll.hide_vote_count or poll.closed
+    show_voters = not poll.hide_votes or poll.closed
+
+    # Votes and participants are tallied in the database in one query; the
+    # per-option tally is skipped entirely while both are hidden
+    vote_counts, total_participants = get_vote_summary(
+        poll.id, with_counts=show_counts or show_voters
+    )
+
     # Poll metadata section - shows the settings and deadline
     metadata_elements = []
 
     # Always show total participants count
-    unique_voters = set(vote.user_id for vote in poll.votes)
-    total_participants = len(unique_voters)
     metadata_elements.append(
-        {"type": "mrkdwn", "text": f"👥 *Total participants:* {total_participants}"}
+        _dumps(
+            {"type": "mrkdwn", "text": f"👥 *Total participants:* {total_participants}"}
+        )
     )
 
     # Add voting settings metadata
     if poll.allow_multiple_votes:
-        metadata_elements.append(
-            {"type": "mrkdwn", "text": "✅ *Multiple votes allowed*"}
-        )
+        metadata_elements.append(_MULTIPLE_VOTES_JSON)
     else:
-        metadata_elements.append({"type": "mrkdwn", "text": "🔒 *Single vote only*"})
+        metadata_elements.append(_SINGLE_VOTE_JSON)
 
     if poll.hide_votes:
-        metadata_elements.append(
-            {"type": "mrkdwn", "text": "👁️‍🗨️ *Individual votes hidden until poll closes*"}
-        )
+        metadata_elements.append(_HIDE_VOTES_JSON)
 
     if poll.hide_vote_count:
-        metadata_elements.append(
-            {
-                "type": "mrkdwn",
-                "text": "🔢 *Option vote counts hidden until poll closes*",
-            }
-        )
+        metadata_elements.append(_HIDE_VOTE_COUNT_JSON)
 
     # Add deadline info if it exists
     if poll.deadline:
-        deadline_str = poll.deadline.strftime("%Y-%m-%d %H:%M:%S")
         metadata_elements.append(
-            {"type": "mrkdwn", "text": f"⏰ *Deadline:* {deadline_str}"}
+            _dumps({"type": "mrkdwn", "text": f"⏰ *Deadline:* {poll.deadline_str}"})
         )
 
     # Add "poll closed" notice if applicable
     if poll.closed:
-        metadata_elements.append({"type": "mrkdwn", "text": "🚫 *This poll is closed*"})
+        metadata_elements.append(_POLL_CLOSED_JSON)
 
     # Only add the metadata section if we have elements
     if metadata_elements:
-        blocks.append({"type": "context", "elements": metadata_elements})
+        blocks.append(
+            '{"type": "context", "elements": ' + _join_blocks(metadata_elements) + "}"
+        )
 
     # Add divider after metadata
-    blocks.append({"type": "divider"})
+    blocks.append(_DIVIDER_JSON)
+
+    # Voter names are only fetched when they will be shown
+    voters_by_option = {}
+    if show_voters:
+        voters_by_option = get_voters_by_option(poll.id)
 
     # Poll options section
     for option in poll.options:
-        # Count votes for this option
-        vote_count = sum(1 for vote in poll.votes if vote.option_id == option.id)
+        vote_count = vote_counts.get(option.id, 0)
 
         # Show voters if not hidden
         voters_text = ""
 
-        # Only show option vote count if not hidden or if poll is closed
         vote_count_text = ""
-        if not poll.hide_vote_count or poll.closed:
+        if show_counts:
             vote_count_text = f" - {vote_count} vote(s)"
 
-        # Only show individual voters if not hidden or if poll is closed and votes were hidden
-        if (not poll.hide_votes or poll.closed) and vote_count > 0:
-            voters = [
-                vote.user_name for vote in poll.votes if vote.option_id == option.id
-            ]
-            voters_text = f" - Votes: {', '.join(voters)}"
+        if show_voters and vote_count > 0:
+            voters_text = f" - Votes: {', '.join(voters_by_option[option.id])}"
 
         # Create section block for option
-        option_block = {
-            "type": "section",
-            "text": {
-                "type": "mrkdwn",
-                "text": f"*{option.text}*{vote_count_text}{voters_text}",
-            },
-        }
+        option_json = '{"type":"section","text":' + _dumps(
+            {"type": "mrkdwn", "text": f"*{option.text}*{vote_count_text}{voters_text}"}
+        )
 
         # Only add vote button if poll is not closed
         if not poll.closed:
-            option_block["accessory"] = {
-                "type": "button",
-                "text": {"type": "plain_text", "text": "Vote"},
-                "value": f"{poll.id}|{option.id}",
-                "action_id": "vote_button",
-                "style": "primary",
-            }
+            option_json += ',"accessory":' + _vote_button_json(option.vote_value)
 
-        blocks.append(option_block)
+        blocks.append(option_json + "}")
 
     # Add controls for poll creator
+    blocks.append(_DIVIDER_JSON)
     if not poll.closed:
-        blocks.append({"type": "divider"})
-        blocks.append(
-            {
-                "type": "actions",
-                "elements": [
-                    {
-                        "type": "button",
-                        "text": {"type": "plain_text", "text": "Close Poll"},
-                        "value": poll.id,
-                        "action_id": "close_poll",
-                        "style": "danger",
-                    }
-                ],
-            }
-        )
+        blocks.append(_close_poll_actions_json(poll.id))
     else:
         # If poll is closed, add show results button
-        blocks.append({"type": "divider"})
-        blocks.append(
-            {
-                "type": "actions",
-                "elements": [
-                    {
-                        "type": "button",
-                        "text": {"type": "plain_text", "text": "Show Results"},
-                        "value": poll.id,
-                        "action_id": "show_results",
-                    }
-                ],
-            }
-        )
+        blocks.append(_show_results_actions_json(poll.id))
 
-    return blocks
+    return _join_blocks(blocks)
 
 
 # Function to generate results blocks
+@cached_blocks
 def generate_results_blocks(poll):
     blocks = [
-        {
-            "type": "header",
-            "text": {"type": "plain_text", "text": f"📊 Results: {poll.question}"},
-        },
-        {"type": "divider"},
+        _dumps(
+            {
+                "type": "header",
+                "text": {"type": "plain_text", "text": f"📊 Results: {poll.question}"},
+            }
+        ),
+        _DIVIDER_JSON,
     ]
 
+    # Tally votes and participants in the database in one query
+    vote_counts, total_participants = get_vote_summary(poll.id)
+
     # Add total participants count
-    unique_voters = set(vote.user_id for vote in poll.votes)
-    total_participants = len(unique_voters)
     blocks.append(
-        {
-            "type": "context",
-            "elements": [
-                {
-                    "type": "mrkdwn",
-                    "text": f"👥 *Total participants:* {total_participants}",
-                }
-            ],
-        }
+        _dumps(
+            {
+                "type": "context",
+                "elements": [
+                    {
+                        "type": "mrkdwn",
+                        "text": f"👥 *Total participants:* {total_participants}",
+                    }
+                ],
+            }
+        )
     )
 
     # Add divider after metadata
-    blocks.append({"type": "divider"})
+    blocks.append(_DIVIDER_JSON)
 
-    # Group votes by option
-    vote_counts = {}
-    for option in poll.options:
-        vote_counts[option.id] = 0
-
-    for vote in poll.votes:
-        vote_counts[vote.option_id] += 1
+    # Fetch voter names only when shown
+    voters_by_option = {}
+    if not poll.hide_votes:
+        voters_by_option = get_voters_by_option(poll.id)
 
     # Sort options by vote count
     sorted_options = sorted(
-        [(option, vote_counts[option.id]) for option in poll.options],
+        [(option, vote_counts.get(option.id, 0)) for option in poll.options],
         key=lambda x: x[1],
         reverse=True,
     )
@@ -278,158 +628,168 @@ def generate_results_blocks(poll):
         vote_count_text = f": {count} vote(s)"
 
         if not poll.hide_votes and count > 0:
-            voters = [
-                vote.user_name for vote in poll.votes if vote.option_id == option.id
-            ]
-            voters_text = f"\nVoters: {', '.join(voters)}"
+            voters_text = f"\nVoters: {', '.join(voters_by_option[option.id])}"
 
         blocks.append(
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"*{option.text}*{vote_count_text}{voters_text}",
-                },
-            }
+            _dumps(
+                {
+                    "type": "section",
+                    "text": {
+                        "type": "mrkdwn",
+                        "text": f"*{option.text}*{vote_count_text}{voters_text}",
+                    },
+                }
+            )
         )
 
-    return blocks
+    return _join_blocks(blocks)
 
 
-# Slash command handler for creating a poll
-@slack_app.command("/poll")
-def create_poll(ack, body, client):
-    # Acknowledge the command request
-    ack()
-
-    # Get channel_id
-    channel_id = body["channel_id"]
-
-    # Open a modal for poll creation
-    try:
-        client.views_open(
-            trigger_id=body["trigger_id"],
-            view={
-                "type": "modal",
-                "callback_id": "poll_creation_modal",
-                "title": {"type": "plain_text", "text": "Create a Poll"},
-                "submit": {"type": "plain_text", "text": "Create"},
-                "close": {"type": "plain_text", "text": "Cancel"},
-                "blocks": [
-                    {
-                        "type": "input",
-                        "block_id": "question_block",
-                        "element": {
-                            "type": "plain_text_input",
-                            "action_id": "question",
-                            "placeholder": {
-                                "type": "plain_text",
-                                "text": "What would you like to know?",
-                            },
-                        },
-                        "label": {"type": "plain_text", "text": "Poll Question"},
-                    },
-                    {
-                        "type": "input",
-                        "block_id": "options_block",
-                        "element": {
-                            "type": "plain_text_input",
-                            "action_id": "options",
-                            "multiline": True,
-                            "placeholder": {
-                                "type": "plain_text",
-                                "text": "Enter one option per line",
-                            },
-                        },
-                        "label": {"type": "plain_text", "text": "Poll Options"},
-                    },
+# The poll creation modal never changes apart from the channel it was opened
+# in, which is passed through private_metadata
+POLL_MODAL_VIEW = {
+    "type": "modal",
+    "callback_id": "poll_creation_modal",
+    "title": {"type": "plain_text", "text": "Create a Poll"},
+    "submit": {"type": "plain_text", "text": "Create"},
+    "close": {"type": "plain_text", "text": "Cancel"},
+    "blocks": [
+        {
+            "type": "input",
+            "block_id": "question_block",
+            "element": {
+                "type": "plain_text_input",
+                "action_id": "question",
+                "placeholder": {
+                    "type": "plain_text",
+                    "text": "What would you like to know?",
+                },
+            },
+            "label": {"type": "plain_text", "text": "Poll Question"},
+        },
+        {
+            "type": "input",
+            "block_id": "options_block",
+            "element": {
+                "type": "plain_text_input",
+                "action_id": "options",
+                "multiline": True,
+                "placeholder": {
+                    "type": "plain_text",
+                    "text": "Enter one option per line",
+                },
+            },
+            "label": {"type": "plain_text", "text": "Poll Options"},
+        },
+        {
+            "type": "input",
+            "block_id": "deadline_block",
+            "optional": True,
+            "element": {"type": "datepicker", "action_id": "deadline_date"},
+            "label": {
+                "type": "plain_text",
+                "text": "Deadline Date (Optional)",
+            },
+        },
+        {
+            "type": "input",
+            "block_id": "deadline_time_block",
+            "optional": True,
+            "element": {"type": "timepicker", "action_id": "deadline_time"},
+            "label": {
+                "type": "plain_text",
+                "text": "Deadline Time (Optional)",
+            },
+        },
+        {
+            "type": "input",
+            "block_id": "settings_block",
+            "optional": True,
+            "element": {
+                "type": "checkboxes",
+                "action_id": "settings",
+                "options": [
                     {
-                        "type": "input",
-                        "block_id": "deadline_block",
-                        "optional": True,
-                        "element": {"type": "datepicker", "action_id": "deadline_date"},
-                        "label": {
+                        "text": {
                             "type": "plain_text",
-                            "text": "Deadline Date (Optional)",
+                            "text": "Allow multiple votes per user",
                         },
+                        "value": "multiple_votes",
                     },
                     {
-                        "type": "input",
-                        "block_id": "deadline_time_block",
-                        "optional": True,
-                        "element": {"type": "timepicker", "action_id": "deadline_time"},
-                        "label": {
+                        "text": {
                             "type": "plain_text",
-                            "text": "Deadline Time (Optional)",
+                            "text": "Hide individual votes until poll is closed",
                         },
+                        "value": "hide_votes",
                     },
                     {
-                        "type": "input",
-                        "block_id": "settings_block",
-                        "optional": True,
-                        "element": {
-                            "type": "checkboxes",
-                            "action_id": "settings",
-                            "options": [
-                                {
-                                    "text": {
-                                        "type": "plain_text",
-                                        "text": "Allow multiple votes per user",
-                                    },
-                                    "value": "multiple_votes",
-                                },
-                                {
-                                    "text": {
-                                        "type": "plain_text",
-                                        "text": "Hide individual votes until poll is closed",
-                                    },
-                                    "value": "hide_votes",
-                                },
-                                {
-                                    "text": {
-                                        "type": "plain_text",
-                                        "text": "Hide option vote counts until poll is closed",
-                                    },
-                                    "value": "hide_vote_count",
-                                },
-                            ],
+                        "text": {
+                            "type": "plain_text",
+                            "text": "Hide option vote counts until poll is closed",
                         },
-                        "label": {"type": "plain_text", "text": "Poll Settings"},
+                        "value": "hide_vote_count",
                     },
                 ],
-                "private_metadata": channel_id,
             },
+            "label": {"type": "plain_text", "text": "Poll Settings"},
+        },
+    ],
+}
+
+
+# Slash command handler for creating a poll
+@slack_app.command("/poll")
+def create_poll(ack, body, client):
+    # Acknowledge the command request
+    ack()
+
+    # Get channel_id
+    channel_id = body["channel_id"]
+
+    # Open a modal for poll creation
+    try:
+        client.views_open(
+            trigger_id=body["trigger_id"],
+            view={**POLL_MODAL_VIEW, "private_metadata": channel_id},
         )
     except SlackApiError as e:
         logger.error(f"Error opening modal: {e}")
 
 
-# Modal submission handler
-@slack_app.view("poll_creation_modal")
-def handle_poll_submission(ack, body, client, view):
-    # Acknowledge the view submission
-    ack()
+def _dg(d, *keys, default=None):
+    """Walk nested payload dicts, returning default if any key is missing"""
+    for key in keys:
+        if not isinstance(d, dict):
+            return default
+        d = d.get(key)
+    return default if d is None else d
+
+
+def post_ephemeral(client, channel, user, text):
+    try:
+        client.chat_postEphemeral(channel=channel, user=user, text=text)
+    except SlackApiError as e:
+        logger.error(f"Error sending ephemeral message: {e}")
+
+
+def process_poll_submission(client, user_id, view):
+    """Create a poll from a submitted poll creation modal and post it"""
+    values = _dg(view, "state", "values", default={})
 
     # Extract values from the modal
-    question = view["state"]["values"]["question_block"]["question"]["value"]
-    options_text = view["state"]["values"]["options_block"]["options"]["value"]
+    question = _dg(values, "question_block", "question", "value")
+    options_text = _dg(values, "options_block", "options", "value", default="")
 
     # Parse deadline if provided
     deadline = None
     try:
-        if (
-            view["state"]["values"]["deadline_block"]["deadline_date"]["selected_date"]
-            and view["state"]["values"]["deadline_time_block"]["deadline_time"][
-                "selected_time"
-            ]
-        ):
-            deadline_date = view["state"]["values"]["deadline_block"]["deadline_date"][
-                "selected_date"
-            ]
-            deadline_time = view["state"]["values"]["deadline_time_block"][
-                "deadline_time"
-            ]["selected_time"]
+        deadline_date = _dg(values, "deadline_block", "deadline_date", "selected_date")
+        deadline_time = _dg(
+            values, "deadline_time_block", "deadline_time", "selected_time"
+        )
 
+        if deadline_date and deadline_time:
             # Parse date and time and create datetime object
             deadline_str = f"{deadline_date} {deadline_time}"
             deadline = datetime.strptime(deadline_str, "%Y-%m-%d %H:%M")
@@ -437,209 +797,162 @@ def handle_poll_submission(ack, body, client, view):
         logger.error(f"Error parsing deadline: {e}")
 
     # Parse settings
-    settings = view["state"]["values"]["settings_block"]["settings"]["selected_options"]
-    allow_multiple_votes = (
-        any(item["value"] == "multiple_votes" for item in settings)
-        if settings
-        else False
-    )
-    hide_votes = (
-        any(item["value"] == "hide_votes" for item in settings) if settings else False
-    )
-    hide_vote_count = (
-        any(item["value"] == "hide_vote_count" for item in settings)
-        if settings
-        else False
-    )
+    settings = _dg(values, "settings_block", "settings", "selected_options", default=[])
+    selected = {item.get("value") for item in settings or ()}
+    allow_multiple_votes = "multiple_votes" in selected
+    hide_votes = "hide_votes" in selected
+    hide_vote_count = "hide_vote_count" in selected
 
-    # Split options by newline
-    option_texts = [opt.strip() for opt in options_text.split("\n") if opt.strip()]
+    # Split options by line, dropping blank ones
+    option_texts = list(filter(None, map(str.strip, options_text.splitlines())))
 
     # Create poll object
     poll = Poll(
         question=question,
-        creator_id=body["user"]["id"],
+        creator_id=user_id,
         allow_multiple_votes=allow_multiple_votes,
         hide_votes=hide_votes,
         hide_vote_count=hide_vote_count,
         deadline=deadline,
-        channel_id=view["private_metadata"],
+        channel_id=_dg(view, "private_metadata"),
     )
 
-    # Add options
-    for text in option_texts:
-        poll.add_option(text)
-
-    # Save poll
-    save_poll(poll)
+    # Save poll together with its options
+    save_poll_with_options(poll, option_texts)
 
     # Post the poll to the channel
-    try:
-        result = client.chat_postMessage(
-            channel=poll.channel_id,
-            blocks=generate_poll_blocks(poll),
-            text=f"Poll: {question}",  # Fallback text for notifications
-        )
-        posthog.capture(
-            "poll_created", properties={"poll_id": poll.id, "user_id": poll.creator_id}
-        )
+    if not poll.channel_id:
+        logger.error("Cannot post poll: channel ID is missing")
+        return poll
+
+    submit_slack_call(
+        post_poll_message,
+        client,
+        poll.id,
+        poll.channel_id,
+        generate_poll_blocks(poll),
+        f"Poll: {question}",  # Fallback text for notifications
+    )
+    capture_event("poll_created", {"poll_id": poll.id, "user_id": poll.creator_id})
+    return poll
 
-        # Store the message timestamp for later updates
-        poll.message_ts = result["ts"]
-        save_poll(poll)
 
-    except SlackApiError as e:
-        logger.error(f"Error posting poll: {e}")
+def _toggle_vote(poll, option_id, user_id, user_name):
+    """Apply a vote click to a poll and return the confirmation text"""
+    # Check if user already voted, loading only their votes
+    user_votes = get_user_vote_ids(poll.id, user_id)
 
+    # If voting for an option the user already picked, remove the vote (toggle)
+    if option_id in user_votes:
+        delete_votes_by_id(poll, [user_votes[option_id]])
+        return "Vote removed."
 
-# Vote button handler
-@slack_app.action("vote_button")
-def handle_vote(ack, body, client):
-    # Acknowledge the button click
-    ack()
+    # If multiple votes aren't allowed, swap the old votes for the new one
+    if not poll.allow_multiple_votes and user_votes:
+        vote = Vote(user_id=user_id, user_name=user_name, option_id=option_id)
+        delete_votes_by_id(poll, list(user_votes.values()), replacement=vote)
+        return "Vote submitted."
+
+    # Add new vote; a duplicate from another process is ignored by the
+    # database's unique (option_id, user_id) index
+    if insert_vote(poll, user_id, user_name, option_id):
+        capture_event("poll_vote_submitted", {"poll_id": poll.id, "user_id": user_id})
+    return "Vote submitted."
 
+
+def process_vote(client, body):
+    """Toggle a user's vote from a vote button click"""
     # Extract poll and option IDs from the button value
     poll_id, option_id = body["actions"][0]["value"].split("|")
-    user_id = body["user"]["id"]
-    user_name = body["user"]["username"]
-
-    # Get the poll
-    poll = get_poll_by_id(poll_id)
-    if not poll:
-        logger.error(f"Poll not found: {poll_id}")
-        return
+    user_id = _dg(body, "user", "id")
+    user_name = _dg(body, "user", "username", default="unknown")
+    channel_id = _dg(body, "channel", "id")
+
+    with _lock_for(poll_id):
+        # Get the poll
+        poll = get_poll_by_id(poll_id)
+        if not poll:
+            logger.error(f"Poll not found: {poll_id}")
+            return
+
+        closed = poll.closed
+        if not closed:
+            try:
+                reply = _toggle_vote(poll, option_id, user_id, user_name)
+            except SQLAlchemyError as e:
+                # e.g. a write conflict with another process on the poll row
+                Session.rollback()
+                logger.error(f"Error recording vote on poll {poll_id}: {e}")
+                reply = "Your vote could not be recorded, please try again."
 
     # Check if poll is already closed
-    if poll.closed:
-        try:
-            client.chat_ephemeral(
-                channel=body["channel"]["id"],
-                user=user_id,
-                text="This poll is already closed.",
-            )
-        except SlackApiError as e:
-            logger.error(f"Error sending ephemeral message: {e}")
-        return
-
-    # Check if user already voted
-    user_votes = [vote for vote in poll.votes if vote.user_id == user_id]
-
-    # If multiple votes aren't allowed and user already voted, remove the old vote
-    if not poll.allow_multiple_votes and user_votes:
-        # If trying to vote for the same option, remove the vote (toggle)
-        if any(vote.option_id == option_id for vote in user_votes):
-            for vote in user_votes[:]:
-                if vote.option_id == option_id:
-                    delete_vote(poll, vote)
-                    client.chat_ephemeral(
-                        channel=body["channel"]["id"],
-                        user=user_id,
-                        text="Vote removed.",
-                    )
-        else:
-            # If voting for a different option, remove old votes and add new one
-            for vote in user_votes[:]:
-                delete_vote(poll, vote)
-
-            # Add new vote
-            vote = Vote(user_id=user_id, user_name=user_name, option_id=option_id)
-            save_vote(poll, vote)
-            client.chat_ephemeral(
-                channel=body["channel"]["id"],
-                user=user_id,
-                text="Vote submitted.",
-            )
-    else:
-        # Check if user already voted for this specific option
-        existing_vote = next(
-            (vote for vote in user_votes if vote.option_id == option_id), None
+    if closed:
+        submit_slack_call(
+            post_ephemeral,
+            client,
+            channel_id,
+            user_id,
+            "This poll is already closed.",
         )
+        return
 
-        if existing_vote:
-            # Remove the vote (toggle behavior)
-            delete_vote(poll, existing_vote)
-            client.chat_ephemeral(
-                channel=body["channel"]["id"],
-                user=user_id,
-                text="Vote removed.",
-            )
-        else:
-            # Add new vote
-            vote = Vote(user_id=user_id, user_name=user_name, option_id=option_id)
-            save_vote(poll, vote)
-            posthog.capture(
-                "poll_vote_submitted",
-                properties={"poll_id": poll.id, "user_id": user_id},
-            )
-            client.chat_ephemeral(
-                channel=body["channel"]["id"],
-                user=user_id,
-                text="Vote submitted.",
-            )
+    submit_slack_call(post_ephemeral, client, channel_id, user_id, reply)
 
     # Update the message with current vote counts
-    try:
-        client.chat_update(
-            channel=body["container"]["channel_id"],
-            ts=body["container"]["message_ts"],
-            blocks=generate_poll_blocks(poll),
-        )
-    except SlackApiError as e:
-        logger.error(f"Error updating poll message: {e}")
+    schedule_poll_update(
+        client,
+        poll_id,
+        _dg(body, "container", "channel_id"),
+        _dg(body, "container", "message_ts"),
+    )
 
 
-# Close poll button handler
-@slack_app.action("close_poll")
-def handle_close_poll(ack, body, client):
-    # Acknowledge the button click
-    ack()
-
+def process_close_poll(client, body):
+    """Close a poll on behalf of its creator"""
     # Extract poll ID
     poll_id = body["actions"][0]["value"]
-    user_id = body["user"]["id"]
-
-    # Get the poll
-    poll = get_poll_by_id(poll_id)
-    if not poll:
-        logger.error(f"Poll not found: {poll_id}")
-        return
+    user_id = _dg(body, "user", "id")
 
-    # Check if user is the creator
-    if poll.creator_id != user_id:
-        try:
-            client.chat_ephemeral(
-                channel=body["channel"]["id"],
-                user=user_id,
-                text="Only the poll creator can close this poll.",
-            )
-        except SlackApiError as e:
-            logger.error(f"Error sending ephemeral message: {e}")
-        return
+    # Close the poll under the lock votes take, since both write its row
+    with _lock_for(poll_id):
+        # Get the poll
+        poll = get_poll_by_id(poll_id)
+        if not poll:
+            logger.error(f"Poll not found: {poll_id}")
+            return
 
-    # Close the poll
-    poll.closed = True
-    save_poll(poll)
+        is_creator = poll.creator_id == user_id
+        if is_creator:
+            close_polls([poll_id])
 
-    # Update the message to show the poll is closed
-    try:
-        client.chat_update(
-            channel=body["container"]["channel_id"],
-            ts=body["container"]["message_ts"],
-            blocks=generate_poll_blocks(poll),
+    # Check if user is the creator
+    if not is_creator:
+        submit_slack_call(
+            post_ephemeral,
+            client,
+            _dg(body, "channel", "id"),
+            user_id,
+            "Only the poll creator can close this poll.",
         )
-    except SlackApiError as e:
-        logger.error(f"Error updating poll message: {e}")
+        return
 
+    # Update the message to show the poll is closed; close_polls expired the
+    # loaded poll, so it is reloaded in its closed state
+    submit_slack_call(
+        update_poll_message,
+        client,
+        _dg(body, "container", "channel_id"),
+        _dg(body, "container", "message_ts"),
+        generate_poll_blocks(poll),
+    )
 
-# Show results button handler
-@slack_app.action("show_results")
-def handle_show_results(ack, body, client):
-    # Acknowledge the button click
-    ack()
 
+def process_show_results(client, body):
+    """Post a poll's results as a new message on behalf of its creator"""
     # Extract poll ID
     poll_id = body["actions"][0]["value"]
-    user_id = body["user"]["id"]
+    user_id = _dg(body, "user", "id")
+    channel_id = _dg(body, "channel", "id")
 
     # Get the poll
     poll = get_poll_by_id(poll_id)
@@ -649,20 +962,23 @@ def handle_show_results(ack, body, client):
 
     # Check if user is the creator
     if poll.creator_id != user_id:
-        try:
-            client.chat_ephemeral(
-                channel=body["channel"]["id"],
-                user=user_id,
-                text="Only the poll creator can show the results.",
-            )
-        except SlackApiError as e:
-            logger.error(f"Error sending ephemeral message: {e}")
+        submit_slack_call(
+            post_ephemeral,
+            client,
+            channel_id,
+            user_id,
+            "Only the poll creator can show the results.",
+        )
+        return
+
+    if not channel_id:
+        logger.error("Cannot post results: channel ID is missing")
         return
 
     # Post results as a new message
     try:
         client.chat_postMessage(
-            channel=body["channel"]["id"],
+            channel=channel_id,
             blocks=generate_results_blocks(poll),
             text=f"Poll Results: {poll.question}",  # Fallback text for notifications
         )
@@ -670,114 +986,78 @@ def handle_show_results(ack, body, client):
         logger.error(f"Error posting results: {e}")
 
 
+# Block actions served by the Bolt listeners and by /slack/events directly
+BLOCK_ACTION_HANDLERS = {
+    "vote_button": process_vote,
+    "close_poll": process_close_poll,
+    "show_results": process_show_results,
+}
+
+
+# Modal submission handler
+@slack_app.view("poll_creation_modal")
+def handle_poll_submission(ack, body, client, view):
+    # Acknowledge the view submission
+    ack()
+    process_poll_submission(client, body["user"]["id"], view)
+
+
+# Vote button handler
+@slack_app.action("vote_button")
+def handle_vote(ack, body, client):
+    # Acknowledge the button click
+    ack()
+    process_vote(client, body)
+
+
+# Close poll button handler
+@slack_app.action("close_poll")
+def handle_close_poll(ack, body, client):
+    # Acknowledge the button click
+    ack()
+    process_close_poll(client, body)
+
+
+# Show results button handler
+@slack_app.action("show_results")
+def handle_show_results(ack, body, client):
+    # Acknowledge the button click
+    ack()
+    process_show_results(client, body)
+
+
+# Return each request thread's session (and its connection) to the pool
+@app.teardown_request
+def remove_session(exception=None):
+    Session.remove()
+
+
 # Flask routes
 @app.route("/slack/events", methods=["POST"])
 def slack_events():
     # Print request details for debugging
-    logger.info(f"Received request headers: {request.headers}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"Received request headers: {request.headers}")
 
     # Check for interactivity payload
     if request.form and "payload" in request.form:
         logger.info("Received interactive payload")
         try:
-            payload = json.loads(request.form["payload"])
+            payload = orjson.loads(request.form["payload"])
             logger.info(f"Payload type: {payload.get('type')}")
 
             # Handle different types of interactions
             if (
                 payload.get("type") == "view_submission"
-                and payload.get("view", {}).get("callback_id") == "poll_creation_modal"
+                and _dg(payload, "view", "callback_id") == "poll_creation_modal"
             ):
                 logger.info("Handling poll creation modal submission")
-                # Manually handle poll submission
                 try:
-                    # Extract values from the modal
-                    view = payload.get("view", {})
-                    state = view.get("state", {}).get("values", {})
-
-                    question = (
-                        state.get("question_block", {}).get("question", {}).get("value")
-                    )
-                    options_text = (
-                        state.get("options_block", {}).get("options", {}).get("value")
-                    )
-
-                    # Parse deadline if provided
-                    deadline = None
-                    try:
-                        deadline_date = (
-                            state.get("deadline_block", {})
-                            .get("deadline_date", {})
-                            .get("selected_date")
-                        )
-                        deadline_time = (
-                            state.get("deadline_time_block", {})
-                            .get("deadline_time", {})
-                            .get("selected_time")
-                        )
-
-                        if deadline_date and deadline_time:
-                            # Parse date and time and create datetime object
-                            deadline_str = f"{deadline_date} {deadline_time}"
-                            deadline = datetime.strptime(deadline_str, "%Y-%m-%d %H:%M")
-                    except Exception as e:
-                        logger.error(f"Error parsing deadline: {e}")
-
-                    # Parse settings
-                    settings = (
-                        state.get("settings_block", {})
-                        .get("settings", {})
-                        .get("selected_options", [])
-                    )
-                    allow_multiple_votes = any(
-                        item.get("value") == "multiple_votes" for item in settings
-                    )
-                    hide_votes = any(
-                        item.get("value") == "hide_votes" for item in settings
-                    )
-                    hide_vote_count = any(
-                        item.get("value") == "hide_vote_count" for item in settings
-                    )
-
-                    # Split options by newline
-                    option_texts = [
-                        opt.strip() for opt in options_text.split("\n") if opt.strip()
-                    ]
-
-                    # Create poll object
-                    poll = Poll(
-                        question=question,
-                        creator_id=payload.get("user", {}).get("id"),
-                        allow_multiple_votes=allow_multiple_votes,
-                        hide_votes=hide_votes,
-                        hide_vote_count=hide_vote_count,
-                        deadline=deadline,
-                        channel_id=view.get("private_metadata"),
+                    process_poll_submission(
+                        slack_app.client,
+                        _dg(payload, "user", "id"),
+                        payload.get("view", {}),
                     )
-
-                    # Add options
-                    for text in option_texts:
-                        poll.add_option(text)
-
-                    # Save poll
-                    save_poll(poll)
-
-                    # Post the poll to the channel
-                    try:
-                        if poll.channel_id:
-                            result = slack_app.client.chat_postMessage(
-                                channel=poll.channel_id,
-                                blocks=generate_poll_blocks(poll),
-                                text=f"Poll: {question}",  # Fallback text for notifications
-                            )
-
-                            # Store the message timestamp for later updates
-                            poll.message_ts = result["ts"]
-                            save_poll(poll)
-                        else:
-                            logger.error("Cannot post poll: channel ID is missing")
-                    except Exception as e:
-                        logger.error(f"Error posting poll: {e}")
                 except Exception as e:
                     logger.error(f"Error processing poll submission: {e}")
                 return ""
@@ -791,182 +1071,27 @@ def slack_events():
                 )
                 logger.info(f"Handling block action: {action_id}")
 
-                # Handle the different action types directly
-                if action_id == "vote_button":
-                    logger.info("Processing vote")
-                    try:
-                        # Extract poll and option IDs from the button value
-                        poll_id, option_id = (
-                            payload.get("actions", [{}])[0].get("value", "").split("|")
-                        )
-                        user_id = payload.get("user", {}).get("id")
-                        user_name = payload.get("user", {}).get("username", "unknown")
-
-                        # Get the poll
-                        poll = get_poll_by_id(poll_id)
-                        if not poll:
-                            logger.error(f"Poll not found: {poll_id}")
-                            return ""
-
-                        # Check if poll is already closed
-                        if poll.closed:
-                            try:
-                                channel_id = payload.get("channel", {}).get("id")
-                                if channel_id and user_id:
-                                    slack_app.client.chat_postEphemeral(
-                                        channel=channel_id,
-                                        user=user_id,
-                                        text="This poll is already closed.",
-                                    )
-                            except Exception as e:
-                                logger.error(f"Error sending ephemeral message: {e}")
-                            return ""
-
-                        # Check if user already voted
-                        user_votes = [
-                            vote for vote in poll.votes if vote.user_id == user_id
-                        ]
-
-                        # If multiple votes aren't allowed and user already voted, remove the old vote
-                        if not poll.allow_multiple_votes and user_votes:
-                            # If trying to vote for the same option, remove the vote (toggle)
-                            if any(vote.option_id == option_id for vote in user_votes):
-                                for vote in user_votes[:]:
-                                    if vote.option_id == option_id:
-                                        delete_vote(poll, vote)
-                            else:
-                                # If voting for a different option, remove old votes and add new one
-                                for vote in user_votes[:]:
-                                    delete_vote(poll, vote)
-
-                                # Add new vote
-                                vote = Vote(
-                                    user_id=user_id,
-                                    user_name=user_name,
-                                    option_id=option_id,
-                                )
-                                save_vote(poll, vote)
-                        else:
-                            # Check if user already voted for this specific option
-                            existing_vote = next(
-                                (
-                                    vote
-                                    for vote in user_votes
-                                    if vote.option_id == option_id
-                                ),
-                                None,
-                            )
-
-                            if existing_vote:
-                                # Remove the vote (toggle behavior)
-                                delete_vote(poll, existing_vote)
-                            else:
-                                # Add new vote
-                                vote = Vote(
-                                    user_id=user_id,
-                                    user_name=user_name,
-                                    option_id=option_id,
-                                )
-                                save_vote(poll, vote)
-
-                        # Update the message with current vote counts
-                        try:
-                            slack_app.client.chat_update(
-                                channel=payload.get("container", {}).get("channel_id"),
-                                ts=payload.get("container", {}).get("message_ts"),
-                                blocks=generate_poll_blocks(poll),
-                            )
-                        except Exception as e:
-                            logger.error(f"Error updating poll message: {e}")
-                    except Exception as e:
-                        logger.error(f"Error processing vote: {e}")
-
-                elif action_id == "close_poll":
-                    logger.info("Processing close poll request")
-                    try:
-                        # Extract poll ID
-                        poll_id = payload.get("actions", [{}])[0].get("value")
-                        user_id = payload.get("user", {}).get("id")
-
-                        # Get the poll
-                        poll = get_poll_by_id(poll_id)
-                        if not poll:
-                            logger.error(f"Poll not found: {poll_id}")
-                            return ""
-
-                        # Check if user is the creator
-                        if poll.creator_id != user_id:
-                            try:
-                                channel_id = payload.get("channel", {}).get("id")
-                                if channel_id and user_id:
-                                    slack_app.client.chat_postEphemeral(
-                                        channel=channel_id,
-                                        user=user_id,
-                                        text="Only the poll creator can close this poll.",
-                                    )
-                            except Exception as e:
-                                logger.error(f"Error sending ephemeral message: {e}")
-                            return ""
-
-                        # Close the poll
-                        poll.closed = True
-                        save_poll(poll)
-
-                        # Update the message to show the poll is closed
-                        try:
-                            slack_app.client.chat_update(
-                                channel=payload.get("container", {}).get("channel_id"),
-                                ts=payload.get("container", {}).get("message_ts"),
-                                blocks=generate_poll_blocks(poll),
-                            )
-                        except Exception as e:
-                            logger.error(f"Error updating poll message: {e}")
-                    except Exception as e:
-                        logger.error(f"Error closing poll: {e}")
-
-                elif action_id == "show_results":
-                    logger.info("Processing show results request")
+                action_handler = BLOCK_ACTION_HANDLERS.get(action_id)
+                if action_handler:
                     try:
-                        # Extract poll ID
-                        poll_id = payload.get("actions", [{}])[0].get("value")
-
-                        # Get the poll
-                        poll = get_poll_by_id(poll_id)
-                        if not poll:
-                            logger.error(f"Poll not found: {poll_id}")
-                            return ""
-
-                        # Post results message
-                        try:
-                            channel_id = payload.get("channel", {}).get("id")
-                            if channel_id:
-                                slack_app.client.chat_postMessage(
-                                    channel=channel_id,
-                                    blocks=generate_results_blocks(poll),
-                                    text=f"Poll Results: {poll.question}",  # Fallback text for notifications
-                                )
-                            else:
-                                logger.error(
-                                    "Cannot post results: channel ID is missing"
-                                )
-                        except Exception as e:
-                            logger.error(f"Error posting results: {e}")
+                        action_handler(slack_app.client, payload)
                     except Exception as e:
-                        logger.error(f"Error showing results: {e}")
+                        logger.error(f"Error handling block action {action_id}: {e}")
 
                 return ""
         except Exception as e:
             logger.error(f"Error handling interactive payload: {e}")
             return ""
 
-    # Log form data
-    form_data = request.form.to_dict() if request.form else {}
-    # For security, don't log the entire token
-    if "token" in form_data:
-        form_data["token"] = (
-            form_data["token"][:5] + "..." if form_data["token"] else "None"
-        )
-    logger.info(f"Request form data: {form_data}")
+    # Log form data, only building the redacted copy if it will be logged
+    if logger.isEnabledFor(logging.INFO):
+        form_data = request.form.to_dict() if request.form else {}
+        # For security, don't log the entire token
+        if "token" in form_data:
+            form_data["token"] = (
+                form_data["token"][:5] + "..." if form_data["token"] else "None"
+            )
+        logger.info(f"Request form data: {form_data}")
 
     # Directly handle SSL check from Slack
     if request.form and "ssl_check" in request.form:
@@ -980,7 +1105,6 @@ def slack_events():
         and request.form["command"] == "/poll"
     ):
         logger.info("Received /poll command")
-        user_id = request.form["user_id"]
         channel_id = request.form["channel_id"]
         trigger_id = request.form["trigger_id"]
 
@@ -988,102 +1112,7 @@ def slack_events():
             # Open poll creation modal
             slack_app.client.views_open(
                 trigger_id=trigger_id,
-                view={
-                    "type": "modal",
-                    "callback_id": "poll_creation_modal",
-                    "title": {"type": "plain_text", "text": "Create a Poll"},
-                    "submit": {"type": "plain_text", "text": "Create"},
-                    "close": {"type": "plain_text", "text": "Cancel"},
-                    "blocks": [
-                        {
-                            "type": "input",
-                            "block_id": "question_block",
-                            "element": {
-                                "type": "plain_text_input",
-                                "action_id": "question",
-                                "placeholder": {
-                                    "type": "plain_text",
-                                    "text": "What would you like to know?",
-                                },
-                            },
-                            "label": {"type": "plain_text", "text": "Poll Question"},
-                        },
-                        {
-                            "type": "input",
-                            "block_id": "options_block",
-                            "element": {
-                                "type": "plain_text_input",
-                                "action_id": "options",
-                                "multiline": True,
-                                "placeholder": {
-                                    "type": "plain_text",
-                                    "text": "Enter one option per line",
-                                },
-                            },
-                            "label": {"type": "plain_text", "text": "Poll Options"},
-                        },
-                        {
-                            "type": "input",
-                            "block_id": "deadline_block",
-                            "optional": True,
-                            "element": {
-                                "type": "datepicker",
-                                "action_id": "deadline_date",
-                            },
-                            "label": {
-                                "type": "plain_text",
-                                "text": "Deadline Date (Optional)",
-                            },
-                        },
-                        {
-                            "type": "input",
-                            "block_id": "deadline_time_block",
-                            "optional": True,
-                            "element": {
-                                "type": "timepicker",
-                                "action_id": "deadline_time",
-                            },
-                            "label": {
-                                "type": "plain_text",
-                                "text": "Deadline Time (Optional)",
-                            },
-                        },
-                        {
-                            "type": "input",
-                            "block_id": "settings_block",
-                            "optional": True,
-                            "element": {
-                                "type": "checkboxes",
-                                "action_id": "settings",
-                                "options": [
-                                    {
-                                        "text": {
-                                            "type": "plain_text",
-                                            "text": "Allow multiple votes per user",
-                                        },
-                                        "value": "multiple_votes",
-                                    },
-                                    {
-                                        "text": {
-                                            "type": "plain_text",
-                                            "text": "Hide individual votes until poll is closed",
-                                        },
-                                        "value": "hide_votes",
-                                    },
-                                    {
-                                        "text": {
-                                            "type": "plain_text",
-                                            "text": "Hide option vote counts until poll is closed",
-                                        },
-                                        "value": "hide_vote_count",
-                                    },
-                                ],
-                            },
-                            "label": {"type": "plain_text", "text": "Poll Settings"},
-                        },
-                    ],
-                    "private_metadata": channel_id,
-                },
+                view={**POLL_MODAL_VIEW, "private_metadata": channel_id},
             )
             return ""  # Empty 200 response to acknowledge
         except Exception as e:
@@ -1106,14 +1135,28 @@ def home():
     return render_template("index.html")
 
 
+# Health probes fire often, so the poll count they report is reused for a
+# few seconds rather than counted on every hit
+POLLS_COUNT_TTL_SECONDS = 5
+_polls_count_cache = (0.0, None)
+
+
+def cached_polls_count():
+    global _polls_count_cache
+    counted_at, polls_count = _polls_count_cache
+    if polls_count is None or time.monotonic() - counted_at > POLLS_COUNT_TTL_SECONDS:
+        polls_count = count_polls()
+        _polls_count_cache = (time.monotonic(), polls_count)
+    return polls_count
+
+
 @app.route("/health", methods=["GET"])
 def health_check():
     """
     Simple health check endpoint that also displays the current Slack app configuration
     """
     # Count polls in the database
-    session = Session()
-    polls_count = session.query(Poll).count()
+    polls_count = cached_polls_count()
 
     return jsonify(
         {
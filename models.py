@@ -1,23 +1,102 @@
-import uuid
+import logging
+import os
+import threading
+from collections import defaultdict
 from datetime import datetime
-
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, String, create_engine, func
+from typing import NamedTuple
+
+import duckdb_engine
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    create_engine,
+    delete,
+    func,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateIndex
+
+logger = logging.getLogger(__name__)
+
+# duckdb_engine opts out of SQLAlchemy's compiled statement cache, so every
+# query would be recompiled on each call. The models only use plain column
+# types, which compile the same way every time, so opt back in.
+duckdb_engine.Dialect.supports_statement_cache = True
 
 # Create SQLAlchemy engine for DuckDB with MotherDuck
 connection_string = "duckdb:///md:dev_poll"
-engine = create_engine(connection_string, echo=True)
-SessionFactory = sessionmaker(bind=engine)
+# Slack listeners and background workers each run on their own thread, so
+# keep enough pooled connections around to avoid reconnecting per call.
+# SQL echo is off by default since it formats and logs every statement.
+engine = create_engine(
+    connection_string,
+    echo=os.environ.get("SQL_ECHO", "").lower() in ("1", "true"),
+    poolclass=QueuePool,
+    pool_size=25,
+    max_overflow=25,
+    pool_recycle=1800,
+)
+# Committed objects keep their loaded state, so reading a poll after saving
+# it does not trigger another SELECT. Each thread's scoped session is removed
+# at the end of every request and background task, so nothing outlives it.
+SessionFactory = sessionmaker(bind=engine, expire_on_commit=False)
 Session = scoped_session(SessionFactory)
 Base = declarative_base()
 
 
+# Ids are random UUID4 strings formatted straight from os.urandom bytes,
+# which are read in batches rather than with one syscall per id
+ID_BATCH_SIZE = 256
+_id_streams = threading.local()
+
+
+def _uuid4_strings():
+    while True:
+        pool = os.urandom(16 * ID_BATCH_SIZE).hex()
+        for start in range(0, len(pool), 32):
+            h = pool[start : start + 32]
+            # Set the version (4) and RFC 4122 variant bits
+            variant = "89ab"[int(h[16], 16) & 3]
+            yield f"{h[:8]}-{h[8:12]}-4{h[13:16]}-{variant}{h[17:20]}-{h[20:]}"
+
+
+def new_id():
+    """Generate a new random UUID4 string id"""
+    stream = getattr(_id_streams, "stream", None)
+    if stream is None:
+        stream = _id_streams.stream = _uuid4_strings()
+    return next(stream)
+
+
+def _reset_id_streams():
+    # A forked child must not hand out ids left over in its parent's batch
+    global _id_streams
+    _id_streams = threading.local()
+
+
+os.register_at_fork(after_in_child=_reset_id_streams)
+
+
 # Model definitions
 class Poll(Base):
     __tablename__ = "polls"
+    # Supports looking up open polls by deadline for the expiry checks. closed
+    # is left out: DuckDB runs updates to indexed columns as delete + insert,
+    # which the poll_options foreign key rejects.
+    __table_args__ = (Index("ix_polls_deadline", "deadline"),)
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, default=new_id)
     question = Column(String, nullable=False)
     creator_id = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.now)
@@ -28,6 +107,8 @@ class Poll(Base):
     closed = Column(Boolean, default=False)
     channel_id = Column(String, nullable=True)
     message_ts = Column(String, nullable=True)
+    # Bumped on every write so rendered messages can be cached per poll state
+    version = Column(Integer, default=0)
 
     # Relationships
     options = relationship(
@@ -35,7 +116,7 @@ class Poll(Base):
     )
 
     def __init__(self, question, creator_id, **kwargs):
-        self.id = kwargs.get("id", str(uuid.uuid4()))
+        self.id = kwargs.get("id") or new_id()
         self.question = question
         self.creator_id = creator_id
         self.created_at = kwargs.get("created_at", datetime.now())
@@ -51,47 +132,48 @@ class Poll(Base):
             str(kwargs.get("channel_id")) if kwargs.get("channel_id") else None
         )
         self.message_ts = kwargs.get("message_ts")
+        self.version = kwargs.get("version", 0)
+
+    @property
+    def deadline_str(self):
+        """The deadline formatted for display, formatted once per deadline value"""
+        if self.deadline is None:
+            return None
+        cached = getattr(self, "_deadline_str", None)
+        if cached is None or cached[0] != self.deadline:
+            cached = self._deadline_str = (
+                self.deadline,
+                self.deadline.strftime("%Y-%m-%d %H:%M:%S"),
+            )
+        return cached[1]
+
+    @property
+    def options_by_id(self):
+        """Options of this poll indexed by option id"""
+        options = self.options
+        # Rebuild when the collection is (re)loaded or options are appended
+        source = getattr(self, "_options_by_id_source", None)
+        if source is None or source[0] is not options or source[1] != len(options):
+            self._options_by_id = {option.id: option for option in options}
+            self._options_by_id_source = (options, len(options))
+        return self._options_by_id
 
-    def add_option(self, text):
-        """Add a new option to this poll"""
-        option = PollOption(text=text, poll=self)
-        session = Session()
-        session.add(option)
-        session.commit()
-        return option
-
-    def get_votes_for_option(self, option_id):
-        """Get all votes for a specific option"""
+    @classmethod
+    def get_polls_with_deadline(cls):
+        """Get all open polls that have a deadline, whether or not it has passed"""
         session = Session()
-        votes = (
-            session.query(Vote)
-            .join(PollOption)
-            .filter(PollOption.poll_id == self.id, Vote.option_id == option_id)
+        return (
+            session.query(cls)
+            .filter(cls.deadline.isnot(None), cls.closed == False)
             .all()
         )
-        return votes
-        
-    def get_total_participants(self):
-        """Get the count of unique users who voted in this poll"""
-        session = Session()
-        return session.query(func.count(func.distinct(Vote.user_id)))\
-            .join(PollOption)\
-            .filter(PollOption.poll_id == self.id)\
-            .scalar() or 0
-
-    @classmethod
-    def get_expired_polls(cls):
-        """Get all polls that have passed their deadline but are not closed yet"""
-        session = Session()
-        now = datetime.now()
-        return session.query(cls).filter(cls.deadline < now, cls.closed == False).all()
 
 
 class PollOption(Base):
     __tablename__ = "poll_options"
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    poll_id = Column(String, ForeignKey("polls.id"))
+    id = Column(String, primary_key=True, default=new_id)
+    poll_id = Column(String, ForeignKey("polls.id"), index=True)
     text = Column(String, nullable=False)
 
     # Relationships
@@ -99,7 +181,7 @@ class PollOption(Base):
     votes = relationship("Vote", back_populates="option", cascade="all, delete-orphan")
 
     def __init__(self, text, poll=None, **kwargs):
-        self.id = kwargs.get("id", str(uuid.uuid4()))
+        self.id = kwargs.get("id") or new_id()
         self.text = text
         if poll:
             self.poll = poll
@@ -107,41 +189,93 @@ class PollOption(Base):
         else:
             self.poll_id = kwargs.get("poll_id")
 
+    @property
+    def vote_value(self):
+        """The "poll_id|option_id" value carried by this option's vote button"""
+        # Ids never change once assigned, so build the string only once
+        value = getattr(self, "_vote_value", None)
+        if value is None:
+            value = self._vote_value = f"{self.poll_id}|{self.id}"
+        return value
+
 
 class Vote(Base):
     __tablename__ = "votes"
+    # A user can vote for each option at most once, whatever the poll settings
+    __table_args__ = (
+        Index("uq_votes_option_user", "option_id", "user_id", unique=True),
+    )
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, default=new_id)
     user_id = Column(String, nullable=False)
     user_name = Column(String, nullable=False)
-    option_id = Column(String, ForeignKey("poll_options.id"))
+    option_id = Column(String, ForeignKey("poll_options.id"), index=True)
     timestamp = Column(DateTime, default=datetime.now)
 
     # Relationships
     option = relationship("PollOption", back_populates="votes")
 
     def __init__(self, user_id, user_name, option_id, **kwargs):
-        self.id = kwargs.get("id", str(uuid.uuid4()))
+        self.id = kwargs.get("id") or new_id()
         self.user_id = user_id
         self.user_name = user_name
         self.option_id = option_id
         self.timestamp = kwargs.get("timestamp", datetime.now())
 
 
+_db_initialized = False
+_init_db_lock = threading.Lock()
+# Names of model indexes that init_db could not create in this database
+_missing_indexes = set()
+
+
 # Create tables
 def init_db():
-    Base.metadata.create_all(engine)
+    """Create any missing tables and indexes, at most once per process"""
+    global _db_initialized
+    with _init_db_lock:
+        if not _db_initialized:
+            _create_schema()
+            _db_initialized = True
 
 
-# Initialize database on module import
-init_db()
+def _create_schema():
+    Base.metadata.create_all(engine)
+    # create_all never alters tables that already exist, so columns added to
+    # the models later are added here for existing databases
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "ALTER TABLE polls ADD COLUMN IF NOT EXISTS version INTEGER DEFAULT 0"
+        )
+    # create_all skips tables that already exist, so indexes added to the
+    # models later are created separately for existing databases
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                with engine.begin() as connection:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+            except SQLAlchemyError as e:
+                # e.g. duplicate votes recorded before the unique index existed
+                logger.warning(f"Could not create index {index.name}: {e}")
+                _missing_indexes.add(index.name)
 
 
 # Helper functions for poll management
 def save_poll(poll):
     """Save a poll to the database"""
     session = Session()
+    poll.version = (poll.version or 0) + 1
+    session.add(poll)
+    session.commit()
+    return poll
+
+
+def save_poll_with_options(poll, option_texts):
+    """Save a new poll and all of its options in a single transaction"""
+    session = Session()
+    poll.version = (poll.version or 0) + 1
     session.add(poll)
+    session.add_all([PollOption(text=text, poll=poll) for text in option_texts])
     session.commit()
     return poll
 
@@ -152,9 +286,155 @@ def get_poll_by_id(poll_id):
     return session.query(Poll).filter(Poll.id == poll_id).first()
 
 
-def get_expired_polls():
-    """Get all polls that have passed their deadline but are not closed yet"""
-    return Poll.get_expired_polls()
+class PollHeader(NamedTuple):
+    """The scalar columns of a poll, for read-only checks"""
+
+    id: str
+    question: str
+    creator_id: str
+    created_at: datetime
+    allow_multiple_votes: bool
+    hide_votes: bool
+    hide_vote_count: bool
+    deadline: datetime | None
+    closed: bool
+    channel_id: str | None
+    message_ts: str | None
+
+
+def get_poll_header(poll_id):
+    """Retrieve a poll's columns as a PollHeader, without loading the ORM object"""
+    session = Session()
+    columns = [getattr(Poll, field) for field in PollHeader._fields]
+    row = session.execute(select(*columns).where(Poll.id == poll_id)).one_or_none()
+    return PollHeader._make(row) if row is not None else None
+
+
+def count_polls():
+    """Count all polls with a plain SELECT count(*)"""
+    session = Session()
+    return session.execute(select(func.count()).select_from(Poll)).scalar()
+
+
+def _participants_count(poll_id):
+    # count(*) over the distinct voters plans better in DuckDB than count(distinct)
+    voters = (
+        select(Vote.user_id)
+        .join(PollOption)
+        .where(PollOption.poll_id == poll_id)
+        .distinct()
+        .subquery()
+    )
+    return select(func.count()).select_from(voters)
+
+
+def get_vote_summary(poll_id, with_counts=True):
+    """Get a poll's ({option_id: vote count}, total participants) in one query"""
+    session = Session()
+    # Without the per-option counts, only the participants are counted
+    if not with_counts:
+        return {}, session.execute(_participants_count(poll_id)).scalar() or 0
+    rows = (
+        session.query(
+            Vote.option_id,
+            func.count(Vote.id),
+            _participants_count(poll_id).scalar_subquery(),
+        )
+        .join(PollOption)
+        .filter(PollOption.poll_id == poll_id)
+        .group_by(Vote.option_id)
+        .all()
+    )
+    vote_counts = {option_id: count for option_id, count, _ in rows}
+    return vote_counts, rows[0][2] if rows else 0
+
+
+def get_option_results(poll_id, include_voters=True):
+    """Get (option_id, text, count, voters) per option of a poll, most voted first"""
+    # voters is a list of {"id", "name"} dicts, or None without include_voters
+    session = Session()
+    columns = [PollOption.id, PollOption.text, func.count(Vote.id)]
+    if include_voters:
+        voted = Vote.id.isnot(None)
+        columns += [
+            func.array_agg(Vote.user_id).filter(voted),
+            func.array_agg(Vote.user_name).filter(voted),
+        ]
+    rows = (
+        session.query(*columns)
+        .outerjoin(Vote)
+        .filter(PollOption.poll_id == poll_id)
+        .group_by(PollOption.id, PollOption.text)
+        .order_by(func.count(Vote.id).desc())
+        .all()
+    )
+    results = []
+    for option_id, text, count, *voter_columns in rows:
+        voters = None
+        if include_voters:
+            user_ids, user_names = (column or [] for column in voter_columns)
+            voters = [
+                {"id": user_id, "name": user_name}
+                for user_id, user_name in zip(user_ids, user_names)
+            ]
+        results.append((option_id, text, count, voters))
+    return results
+
+
+def get_voters_by_option(poll_id):
+    """Get the names of each option's voters as {option_id: [user_name, ...]}"""
+    session = Session()
+    rows = (
+        session.query(Vote.option_id, Vote.user_name)
+        .join(PollOption)
+        .filter(PollOption.poll_id == poll_id)
+        .order_by(Vote.timestamp)
+        .all()
+    )
+    voters = defaultdict(list)
+    for option_id, user_name in rows:
+        voters[option_id].append(user_name)
+    return voters
+
+
+def _close_polls(*criteria):
+    # DuckDB rejects UPDATE ... RETURNING on polls because poll_options
+    # references it, so select the ids first within the same transaction
+    session = Session()
+    open_polls = (Poll.closed == False, *criteria)
+    poll_ids = session.scalars(select(Poll.id).where(*open_polls)).all()
+    if poll_ids:
+        session.execute(
+            update(Poll)
+            .where(Poll.id.in_(poll_ids))
+            .values(closed=True, version=func.coalesce(Poll.version, 0) + 1),
+            execution_options={"synchronize_session": False},
+        )
+    session.commit()
+    # Polls already loaded in this session are now out of date
+    session.expire_all()
+    return poll_ids
+
+
+def close_polls(poll_ids):
+    """Close those of the given polls that are still open, returning their ids"""
+    return _close_polls(Poll.id.in_(poll_ids))
+
+
+def close_expired_polls():
+    """Close every open poll past its deadline, returning their ids"""
+    return _close_polls(Poll.deadline < datetime.now())
+
+
+def get_polls_by_ids(poll_ids):
+    """Retrieve several polls by their IDs in one query"""
+    session = Session()
+    return session.query(Poll).filter(Poll.id.in_(poll_ids)).all()
+
+
+def get_polls_with_deadline():
+    """Get all open polls that have a deadline, whether or not it has passed"""
+    return Poll.get_polls_with_deadline()
 
 
 def delete_poll(poll_id):
@@ -168,25 +448,51 @@ def delete_poll(poll_id):
     return False
 
 
-def save_vote(poll, vote_data):
-    """Add a vote to a poll"""
+def insert_vote(poll, user_id, user_name, option_id):
+    """Record a vote unless the user already has one for that option"""
+    # Returns whether a vote was added
     session = Session()
-    vote = Vote(
-        user_id=vote_data["user_id"],
-        user_name=vote_data["user_name"],
-        option_id=vote_data["option_id"],
+    statement = insert(Vote).values(
+        id=new_id(),
+        user_id=user_id,
+        user_name=user_name,
+        option_id=option_id,
+        timestamp=datetime.now(),
     )
-    session.add(vote)
+    # Without the unique index there is no conflict target to skip on, so
+    # votes stay unique only for callers that serialize each poll's writes,
+    # as the Slack vote path does with its per-poll lock
+    if "uq_votes_option_user" not in _missing_indexes:
+        statement = statement.on_conflict_do_nothing(
+            index_elements=["option_id", "user_id"]
+        )
+    inserted = session.execute(statement.returning(Vote.id)).first()
+    if inserted:
+        poll.version = (poll.version or 0) + 1
+        session.add(poll)
     session.commit()
-    return vote
+    return inserted is not None
 
 
-def delete_vote(vote_id):
-    """Remove a vote"""
+def get_user_vote_ids(poll_id, user_id):
+    """Get one user's votes on a poll as {option_id: vote_id}"""
     session = Session()
-    vote = session.query(Vote).filter(Vote.id == vote_id).first()
-    if vote:
-        session.delete(vote)
-        session.commit()
-        return True
-    return False
+    rows = (
+        session.query(Vote.option_id, Vote.id)
+        .join(PollOption)
+        .filter(PollOption.poll_id == poll_id, Vote.user_id == user_id)
+        .all()
+    )
+    return dict(rows)
+
+
+def delete_votes_by_id(poll, vote_ids, replacement=None):
+    """Delete votes from a poll by id, optionally adding a new one, in one commit"""
+    session = Session()
+    poll.version = (poll.version or 0) + 1
+    session.add(poll)
+    session.execute(delete(Vote).where(Vote.id.in_(vote_ids)))
+    if replacement is not None:
+        session.add(replacement)
+    session.commit()
+    return replacement
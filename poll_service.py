@@ -1,7 +1,18 @@
 import logging
-from datetime import datetime
 
-from models import Poll, Vote, delete_vote, get_poll_by_id, save_poll, save_vote
+from models import (
+    Poll,
+    Vote,
+    close_expired_polls,
+    close_polls,
+    delete_votes_by_id,
+    get_option_results,
+    get_poll_by_id,
+    get_poll_header,
+    get_user_vote_ids,
+    insert_vote,
+    save_poll_with_options,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -41,11 +52,8 @@ class PollService:
             channel_id=channel_id,
         )
 
-        # Add options
-        for option_text in options:
-            poll.add_option(option_text)
-
-        save_poll(poll)
+        # Save the poll and its options in one transaction
+        save_poll_with_options(poll, options)
         logger.info(f"Created poll {poll.id} with {len(options)} options")
         return poll
 
@@ -71,38 +79,28 @@ class PollService:
             return False, "Poll is closed"
 
         # Check if option exists
-        if not any(option.id == option_id for option in poll.options):
+        if option_id not in poll.options_by_id:
             return False, "Option not found"
 
-        # Check if user already voted
-        user_votes = [vote for vote in poll.votes if vote.user_id == user_id]
+        # Check if user already voted, loading only their votes
+        user_votes = get_user_vote_ids(poll_id, user_id)
+
+        # If voting for an option the user already picked, remove the vote (toggle)
+        if option_id in user_votes:
+            delete_votes_by_id(poll, [user_votes[option_id]])
+            return True, "Vote removed"
 
-        # If multiple votes aren't allowed and user already voted
+        # If multiple votes aren't allowed, replace the old votes with the new one
         if not poll.allow_multiple_votes and user_votes:
-            # If voting for same option, remove the vote (toggle)
-            if any(vote.option_id == option_id for vote in user_votes):
-                for vote in user_votes[:]:
-                    if vote.option_id == option_id:
-                        delete_vote(poll, vote)
-                return True, "Vote removed"
-            else:
-                # If voting for a different option, remove old votes
-                for vote in user_votes[:]:
-                    delete_vote(poll, vote)
-        else:
-            # Check if user already voted for this specific option
-            existing_vote = next(
-                (vote for vote in user_votes if vote.option_id == option_id), None
-            )
-
-            if existing_vote:
-                # Remove the vote (toggle behavior)
-                delete_vote(poll, existing_vote)
-                return True, "Vote removed"
-
-        # Add new vote
-        vote = Vote(user_id=user_id, user_name=user_name, option_id=option_id)
-        save_vote(poll, vote)
+            vote = Vote(user_id=user_id, user_name=user_name, option_id=option_id)
+            delete_votes_by_id(poll, list(user_votes.values()), replacement=vote)
+            return True, "Vote added"
+
+        # Add new vote; a duplicate from a concurrent click is ignored by the
+        # database's unique (option_id, user_id) index. This service takes no
+        # lock, so on databases without that index the check above can race.
+        if not insert_vote(poll, user_id, user_name, option_id):
+            return False, "Vote already recorded"
         return True, "Vote added"
 
     @staticmethod
@@ -117,7 +115,8 @@ class PollService:
         Returns:
             tuple: (success, message)
         """
-        poll = get_poll_by_id(poll_id)
+        # Only the poll's columns are needed to check the request
+        poll = get_poll_header(poll_id)
         if not poll:
             return False, "Poll not found"
 
@@ -127,8 +126,9 @@ class PollService:
         if poll.creator_id != user_id:
             return False, "Only the poll creator can close this poll"
 
-        poll.closed = True
-        save_poll(poll)
+        # Closes the poll only if it is still open, e.g. not closed by its deadline
+        if not close_polls([poll_id]):
+            return False, "Poll is already closed"
         return True, "Poll closed successfully"
 
     @staticmethod
@@ -142,7 +142,8 @@ class PollService:
         Returns:
             dict: Poll results data
         """
-        poll = get_poll_by_id(poll_id)
+        # Read-only, so skip loading the ORM object
+        poll = get_poll_header(poll_id)
         if not poll:
             return None
 
@@ -155,26 +156,21 @@ class PollService:
             "options": [],
         }
 
-        # Add results for each option
-        for option in poll.options:
-            votes = poll.get_votes_for_option(option.id)
+        # Add results for each option, already sorted by vote count descending
+        option_results = get_option_results(poll_id, include_voters=not poll.hide_votes)
+        for option_id, text, count, voters in option_results:
             option_result = {
-                "id": option.id,
-                "text": option.text,
-                "count": len(votes),
+                "id": option_id,
+                "text": text,
+                "count": count,
             }
 
             # Add voter information if votes aren't hidden
             if not poll.hide_votes:
-                option_result["voters"] = [
-                    {"id": vote.user_id, "name": vote.user_name} for vote in votes
-                ]
+                option_result["voters"] = voters
 
             results["options"].append(option_result)
 
-        # Sort options by vote count descending
-        results["options"].sort(key=lambda x: x["count"], reverse=True)
-
         return results
 
     @staticmethod
@@ -185,14 +181,9 @@ class PollService:
         Returns:
             list: List of poll IDs that were closed
         """
-        closed_polls = []
-        current_time = datetime.now()
-
-        for poll_id, poll in Poll.polls.items():
-            if poll.deadline and current_time > poll.deadline and not poll.closed:
-                poll.closed = True
-                save_poll(poll)
-                closed_polls.append(poll_id)
-                logger.info(f"Automatically closed poll {poll_id} due to deadline")
+        # Close all expired polls with a single UPDATE
+        closed_polls = close_expired_polls()
+        for poll_id in closed_polls:
+            logger.info(f"Automatically closed poll {poll_id} due to deadline")
 
         return closed_polls